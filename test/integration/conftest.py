@@ -0,0 +1,46 @@
+'''
+MIT License
+
+Copyright (c) 2022 Futurewei Cloud
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import logging
+import pytest
+
+# Logging is configured through pytest's own options, e.g. --log-level=INFO to capture every call
+# made by the client, or --log-cli-level=INFO to print them as the tests run
+def pytest_configure(config):
+    # keep the per-connection messages of urllib3 out of the client logs
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+# The defaults can be given through the environment, e.g. to run a subset of the tests
+# with a plain "pytest" invocation or under pytest-xdist without repeating the options
+def pytest_addoption(parser):
+    parser.addoption("--http", default=os.environ.get("SKV_HTTP", "http://localhost:8080"),
+        help="HTTP API URL (env SKV_HTTP)")
+    parser.addoption("--prometheus", default=os.environ.get("SKV_PROM", "http://localhost:8089"),
+        help="HTTP Proxy Prometheus port (env SKV_PROM)")
+
+@pytest.fixture(scope="session")
+def args(request):
+    "Command line options of the integration tests, resolved once per test process"
+    return request.config.option
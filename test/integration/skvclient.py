@@ -23,27 +23,35 @@ SOFTWARE.
 '''
 
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 from urllib.parse import urlparse
-import copy
 from enum import Enum
 from typing import List
 import re
+import math
 import msgpack
+import json
 from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+MSGPACK_HEADERS = {'Content-Type': 'application/x-msgpack', 'Accept': 'application/x-msgpack'}
+
 class TimeDelta(timedelta):
     def serialize(self):
         return int(self.total_seconds()*1000*1000*1000)
 
 class Status:
     "Status returned from HTTP Proxy"
+    __slots__ = ('code', 'message', '_is2xxOK')
 
     def __init__(self, status):
         "Get status from status tuple"
         self.code, self.message = status
+        # checked after nearly every call, so computed once here
+        self._is2xxOK = self.code >= 200 and self.code < 300
 
     def __str__(self):
         return f"{self.code}: {self.message.decode('ascii')}"
@@ -55,7 +63,7 @@ class Status:
         return self.code < 200
 
     def is2xxOK(self):
-        return self.code >= 200 and self.code < 300
+        return self._is2xxOK
 
     def is3xxRedirect(self):
         return self.code >= 300 and self.code < 400
@@ -240,11 +248,33 @@ class Txn:
             [self.timestamp, endAction.serialize()])
         return status
 
-class Data:
-    'data storage class for records'
-    pass
+class RecordFields:
+    '''Field values of a record, accessed by name, e.g. rec.fields.partitionKey.
+    Values are kept in one list in schema order and looked up through a name->position
+    index shared by all records of a schema.'''
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index = None, values = None):
+        self._index = index if index is not None else {}
+        self._values = values if values is not None else []
+
+    def __getattr__(self, name):
+        # only reached for names other than the slots, except while the slots are unset
+        if name in RecordFields.__slots__:
+            raise AttributeError(name)
+        pos = self._index.get(name)
+        # prefix records only hold the leading fields
+        if pos is None or pos >= len(self._values):
+            raise AttributeError(name)
+        return self._values[pos]
+
+    def __len__(self):
+        return len(self._values)
 
 class Record:
+    __slots__ = ('schemaName', 'schemaVersion', '_posFields', 'excludedFields',
+                 'timestamp', 'fieldsForPartialUpdate', 'fields')
+
     def __init__(self, schemaName, schemaVersion):
         self.schemaName = schemaName
         self.schemaVersion = schemaVersion
@@ -252,16 +282,39 @@ class Record:
         self.excludedFields=[]
         self.timestamp = None
         self.fieldsForPartialUpdate=[]
-        self.fields = Data()
+        self.fields = RecordFields()
 
     @property
     def data(self):
         'Used to compare two records as dict'
-        return self.fields.__dict__
+        values = self.fields._values
+        return {name: values[pos] for name, pos in self.fields._index.items() if pos < len(values)}
+
+    def __copy__(self):
+        'Shallow copy which does not share the mutable field containers with the original'
+        rec = Record.__new__(Record)
+        rec.schemaName = self.schemaName
+        rec.schemaVersion = self.schemaVersion
+        rec.timestamp = self.timestamp
+        rec._posFields = list(self._posFields)
+        rec.excludedFields = list(self.excludedFields)
+        rec.fieldsForPartialUpdate = list(self.fieldsForPartialUpdate)
+        rec.fields = self.fields # field values are read-only
+        return rec
+
+    def _replace(self, **changes):
+        'Returns a copy of the record with the given attributes replaced, e.g. rec._replace(schemaVersion=2)'
+        rec = self.__copy__()
+        for name, value in changes.items():
+            setattr(rec, name, value)
+        return rec
 
     def serialize(self):
-        fieldData = b''.join([msgpack.packb(field) for field in self._posFields])
-        return [self.excludedFields, len(self.fields.__dict__), fieldData, self.schemaVersion]
+        # pack all fields into a single buffer rather than joining one bytes object per field
+        packer = msgpack.Packer(autoreset=False)
+        for field in self._posFields:
+            packer.pack(field)
+        return [self.excludedFields, len(self.fields), packer.bytes(), self.schemaVersion]
 
 class SchemaField:
     def __init__(self, type: FieldType, name: str,
@@ -284,36 +337,57 @@ class Schema:
         self.fields = fields
         self.partitionKeyFields = partitionKeyFields
         self.rangeKeyFields = rangeKeyFields
+        self._index = None
+        # schemas are not modified after construction, so the serialized form identifies the schema
+        self._fingerprint = msgpack.packb(self.serialize(), use_bin_type=True)
+
+    def __eq__(self, other):
+        return isinstance(other, Schema) and self._fingerprint == other._fingerprint
+
+    def __hash__(self):
+        return hash(self._fingerprint)
+
+    @property
+    def _fieldIndex(self):
+        'field name -> position, shared by the RecordFields of all records of this schema'
+        if self._index is None:
+            self._index = {}
+            for i, field in enumerate(self.fields):
+                name = field.name.decode('ascii') if isinstance(field.name, bytes) else field.name
+                # a repeated name resolves to its first position, which prefix records also hold
+                self._index.setdefault(name, i)
+        return self._index
 
     def make_record(self, **dataFields):
         rec = Record(self.name, self.version)
+        values = []
         for i,field in enumerate(self.fields):
             dname = field.name.decode('ascii')
             if dname in dataFields:
                 fieldValue = dataFields.get(dname)
                 rec._posFields.append(fieldValue)
-                rec.fields.__dict__[dname] = fieldValue
+                values.append(fieldValue)
             else:
                 if not rec.excludedFields:
                     rec.excludedFields = [False] * len(self.fields)
                 rec.excludedFields[i] = True
-                rec.fields.__dict__[dname] = None
+                values.append(None)
+        rec.fields = RecordFields(self._fieldIndex, values)
         return rec
 
     # For use in creating key records for a prefix query. The difference is fields that are not set
     # are not set in excludedFields and are not set to None
     def make_prefix_record(self, **dataFields):
         rec = Record(self.name, self.version)
-        for i,field in enumerate(self.fields):
+        for field in self.fields:
             dname = field.name.decode('ascii')
             if dname in dataFields:
-                fieldValue = dataFields.get(dname)
-                rec._posFields.append(fieldValue)
-                rec.fields.__dict__[dname] = fieldValue
+                rec._posFields.append(dataFields.get(dname))
             else:
                 break
-        if len(rec.fields.__dict__) != len(dataFields):
+        if len(rec._posFields) != len(dataFields):
             raise ValueError("dataFields given are not a prefix")
+        rec.fields = RecordFields(self._fieldIndex, list(rec._posFields))
         return rec
 
     def parse_read(self, storage, timestamp):
@@ -325,15 +399,15 @@ class Schema:
 
         unp = msgpack.Unpacker()
         unp.feed(storage[2])
-        for i,field in enumerate(self.fields):
-            dname = field.name.decode('ascii')
+        values = []
+        for i in range(len(self.fields)):
             fv = None
             if not excl[i]:
                 fv = unp.unpack()
                 rec._posFields.append(fv)
+            values.append(fv)
 
-            rec.fields.__dict__[dname] = fv
-
+        rec.fields = RecordFields(self._fieldIndex, values)
         return rec
 
     def serialize(self):
@@ -398,24 +472,71 @@ class FieldValue(dict):
     def __init__(self, type: FieldType, value: object):
         dict.__init__(self, type = type, value = value)
 
+class Pipeline:
+    "Issues independent client calls concurrently over the client's pooled connections"
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        "Schedule fn(*args, **kwargs); the result is available via the returned future"
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True)
+        return False
+
 class SKVClient:
     "SKV DB client"
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, pool_connections: int = 8, pool_maxsize: int = 32):
+        # All calls go through one session so that keep-alive connections are reused
+        # instead of opening a new TCP connection per request
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # every API call is msgpack in both directions
+        self.session.headers.update(MSGPACK_HEADERS)
         self.http = url
         self._schemas = {}
+        # path -> PreparedRequest with url and headers already resolved, see _prepare_call
+        self._templates = {}
+
+    def close(self):
+        "Close the pooled connections"
+        self.session.close()
+
+    def pipeline(self, max_workers: int = 4) -> Pipeline:
+        '''Returns a context manager used to issue calls which do not depend on each other.
+        All submitted calls are completed when the context exits.'''
+        return Pipeline(max_workers)
+
+    def _prepare_call(self, path, body: bytes) -> requests.PreparedRequest:
+        '''Calls to the same path only differ by body, so the session-level work (url parsing,
+        header and cookie merging) is done once per path. Each call gets its own copy of the
+        template so that concurrent calls, e.g. from a pipeline, do not share the body.'''
+        template = self._templates.get(path)
+        if template is None:
+            template = self.session.prepare_request(requests.Request('POST', self.http + path))
+            self._templates[path] = template
+        req = template.copy()
+        req.prepare_body(body, None)
+        return req
 
     def make_call(self, path, data):
         url = self.http + path
-        logger.info("calling {} with data {}".format(url, data))
+        logger.info("calling %s with data %s", url, data)
         try:
             datab = msgpack.packb(data, use_bin_type=True)
         except Exception as exc:
             logger.exception("Unable to serialize request")
             return (Status([501, "Unable to serialize request due to: {}".format(exc)]), None)
 
-        resp = self.session.post(url, data=datab, headers={'Content-Type': 'application/x-msgpack', 'Accept': 'application/x-msgpack'})
+        resp = self.session.send(self._prepare_call(path, datab))
 
         if resp.status_code != 200:
             msg = "Unable to issue call with data: {}, due to: {}".format(data, resp)
@@ -482,7 +603,8 @@ class SKVClient:
         url = self.http + "/api/GetKeyString"
         req = {"fields": fields}
         data = json.dumps(req)
-        r = requests.post(url, data=data)
+        # override the msgpack headers set on the session
+        r = self.session.post(url, data=data, headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
         result = r.json()
         output = result["response"]["result"] if "response" in result else None
         return Status(result), output
@@ -495,41 +617,66 @@ class Counter:
         self.name = name
         self.short_name = short_name if short_name else name
 
+    @property
+    def sample_name(self):
+        "Name of the metric's samples in the /metrics output"
+        return f"{self.module}_{self.context}_{self.name}"
+
 class Histogram (Counter):
-    pass
+    # format HttpProxy_K23SI_client_write_latency_bucket{le="9288586.978427",shard="0"} 7
+    @property
+    def sample_name(self):
+        return f"{self.module}_{self.context}_{self.name}_bucket"
 
 class MetricsSnapShot:
 
-    def _set_counter(self, text: str, c: Counter):
-        name = f"{c.module}_{c.context}_{c.name}"
-        expr = f"^{name}.*\s(\d+)"
-        match = re.search(expr, text, re.MULTILINE)
-        val = 0 if match is None else int(match.group(1))
-        setattr(self, c.short_name, val)
+    def _set_counter(self, samples: dict, c: Counter):
+        setattr(self, c.short_name, samples.get(c.sample_name, 0))
 
-    # format HttpProxy_K23SI_client_write_latency_bucket{le="9288586.978427",shard="0"} 7
-    def _set_histogram(self, text: str, h: Histogram):
-        search = f'{h.module}_{h.context}_{h.name}_bucket{{le="+Inf"'
-        escape = re.escape(search)
-        expr = f"^{escape}.*\s(\d+)"
-        match = re.search(expr, text, re.MULTILINE)
-        val = 0 if match is None else int(match.group(1))
-        setattr(self, h.short_name, val)
+    def _set_histogram(self, samples: dict, h: Histogram):
+        setattr(self, h.short_name, samples.get(h.sample_name, 0))
+
+# name{labels} value [timestamp]
+_SAMPLE_RE = re.compile(r'^([^{\s]+)(\{.*\})?\s+(\S+)(\s+\S+)?$')
 
 class MetricsClient:
     def __init__(self, url: str,
             metrices: [Counter]):
         self.http = url
         self.metrices = metrices
+        self.session = requests.Session()
+
+    @staticmethod
+    def _parse(text: str, names: set) -> dict:
+        '''Parse the prometheus text format into {metric name: value of its first sample}, for the
+        given sample names only. For histograms only the le="+Inf" bucket, i.e. the total count, is
+        kept. Samples with a non-finite value (NaN, +Inf) are skipped'''
+        samples = {}
+        for line in text.splitlines():
+            if not line or line.startswith('#'):
+                continue
+            match = _SAMPLE_RE.match(line)
+            if match is None:
+                continue
+            name, labels, value, _ = match.groups()
+            if name not in names or name in samples:
+                continue
+            if name.endswith('_bucket') and 'le="+Inf"' not in (labels or ''):
+                continue
+            value = float(value)
+            if math.isfinite(value):
+                samples[name] = int(value)
+        return samples
 
     def refresh(self) -> MetricsSnapShot:
+        "Scrape /metrics once and take all requested metrics from that response"
         url = self.http + "/metrics"
-        r = requests.get(url)
-        text = r.text
+        r = self.session.get(url)
+        samples = MetricsClient._parse(r.text, {m.sample_name for m in self.metrices})
         metrics = MetricsSnapShot()
         for m in self.metrices:
             if isinstance(m, Histogram):
-                metrics._set_histogram(text, m)
+                metrics._set_histogram(samples, m)
             else:
-                metrics._set_counter(text, m)
+                metrics._set_counter(samples, m)
         return metrics
@@ -24,229 +24,224 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
-import argparse, unittest, sys
+import sys
+import pytest
 from skvclient import (CollectionMetadata, CollectionCapacity, SKVClient,
     HashScheme, StorageDriver, Schema, SchemaField, FieldType, TimeDelta,
     Operation, Value, Expression, TxnOptions)
-import logging
-from copy import copy
 from time import sleep
 
-class TestHTTP(unittest.TestCase):
-    args = None
-    cl = None
-    schema = None
+def _already_exists(status, message: str):
+    msg = status.message.decode('ascii') if isinstance(status.message, bytes) else status.message
+    return status.code == 403 and message in msg
+
+def ensure_collection_schema(cl, metadata: CollectionMetadata, schema: Schema):
+    "Create collection and schema unless they already exist, e.g. from a previous run against the same cluster"
+    status, existing = cl.get_schema(metadata.name, schema.name, schema.version)
+    if status.is2xxOK():
+        return status, existing
+
+    # When test cases run in parallel (pytest -n) another worker may create them concurrently,
+    # in which case the create calls fail with 403. The CPO also uses 403 for real failures,
+    # e.g. no free nodes, so only "collection already exists" is accepted
+    status = cl.create_collection(metadata)
+    if not status.is2xxOK() and not _already_exists(status, "collection already exists"):
+        return status, None
+
+    status = cl.create_schema(metadata.name, schema)
+    if _already_exists(status, "Schema name and version already exist"):
+        return cl.get_schema(metadata.name, schema.name, schema.version)
+    return status, schema if status.is2xxOK() else None
+
+@pytest.fixture(scope="module")
+def cl(args):
+    "Client shared by all test cases"
+    client = SKVClient(args.http)
+    yield client
+    client.close()
+
+@pytest.fixture(scope="module")
+def schema(cl):
+    "Create common schema and collection used by multiple test cases"
+    metadata = CollectionMetadata(
+        name = TestHTTP.cname,
+        hashScheme = HashScheme.HashCRC32C,
+        storageDriver = StorageDriver.K23SI,
+        capacity = CollectionCapacity(minNodes = 2),
+        retentionPeriod = TimeDelta(hours=5)
+    )
+    schema = Schema(
+        name=b'test_schema',
+        version=1,
+        fields=[
+            SchemaField(FieldType.STRING, b'partitionKey'),
+            SchemaField(FieldType.STRING, b'rangeKey'),
+            SchemaField(FieldType.STRING, b'data')],
+        partitionKeyFields=[0],
+        rangeKeyFields=[1]
+    )
+    status, _ = ensure_collection_schema(cl, metadata, schema)
+    if not status.is2xxOK():
+        raise Exception(status.message)
+    return schema
+
+@pytest.fixture(scope="class")
+def validation_txn(cl, schema):
+    "Txn shared by the TestValidation cases"
+    # Get a txn
+    status, txn = cl.begin_txn()
+    assert status.is2xxOK(), status.message
+    yield txn
+
+    # End transaction, should succeed
+    status = txn.end()
+    assert status.is2xxOK(), status.message
+
+@pytest.fixture
+def key_prefix(request):
+    "Key prefix unique to each test case, so that test cases can run in parallel, e.g. pytest -n 4"
+    return request.node.name.encode()
+
+class TestHTTP:
     cname = b'HTTPClient'
 
-    @classmethod
-    def setUpClass(cls):
-        "Create common schema and collection used by multiple test cases"
-        logging.basicConfig(format='%(asctime)s [%(levelname)s] (%(module)s) %(message)s', level=logging.DEBUG)
-        metadata = CollectionMetadata(
-            name = TestHTTP.cname,
-            hashScheme = HashScheme.HashCRC32C,
-            storageDriver = StorageDriver.K23SI,
-            capacity = CollectionCapacity(minNodes = 2),
-            retentionPeriod = TimeDelta(hours=5)
-        )
-        TestHTTP.cl = SKVClient(TestHTTP.args.http)
-        status = TestHTTP.cl.create_collection(metadata)
-        if not status.is2xxOK():
-            raise Exception(status.message)
-
-        TestHTTP.schema = Schema(
-            name=b'test_schema',
-            version=1,
-            fields=[
-                SchemaField(FieldType.STRING, b'partitionKey'),
-                SchemaField(FieldType.STRING, b'rangeKey'),
-                SchemaField(FieldType.STRING, b'data')],
-            partitionKeyFields=[0],
-            rangeKeyFields=[1]
-        )
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, TestHTTP.schema)
-        if not status.is2xxOK():
-            raise Exception(status.message)
+    def test_basicTxn(self, cl, schema, key_prefix):
+        pk1 = key_prefix + b"test1pk"
+        pk2 = key_prefix + b"test2pk"
 
-    def test_basicTxn(self):
         # Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Write
-        record = TestHTTP.schema.make_record(partitionKey=b"test2pk", rangeKey=b"test1rk", data=b"mydata")
+        record = schema.make_record(partitionKey=pk2, rangeKey=b"test1rk", data=b"mydata")
         status = txn.write(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK(), msg=status.message)
+        assert status.is2xxOK(), status.message
 
         # Abort
         status = txn.end(False)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # Begin Txn
-        self.assertTrue(True)
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Write
-        record = TestHTTP.schema.make_record(partitionKey=b"test1pk", rangeKey=b"test1rk", data=b"mydata")
+        record = schema.make_record(partitionKey=pk1, rangeKey=b"test1rk", data=b"mydata")
         status = txn.write(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
-        # Read 404
-        record = TestHTTP.schema.make_record(partitionKey=b"test2pk", rangeKey=b"test1rk")
-        status, resultRec = txn.read(TestHTTP.cname, record)
-        self.assertEqual(status.code, 404)
+        # Read 404 and read data, independent of each other so issue them together
+        missRecord = schema.make_record(partitionKey=pk2, rangeKey=b"test1rk")
+        hitRecord = schema.make_record(partitionKey=pk1, rangeKey=b"test1rk")
+        with cl.pipeline() as p:
+            missRead = p.submit(txn.read, TestHTTP.cname, missRecord)
+            hitRead = p.submit(txn.read, TestHTTP.cname, hitRecord)
 
-        # read data
-        record = TestHTTP.schema.make_record(partitionKey=b"test1pk", rangeKey=b"test1rk")
-        status, resultRec = txn.read(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK());
-        self.assertEqual(resultRec.fields.partitionKey, b"test1pk")
-        self.assertEqual(resultRec.fields.rangeKey, b"test1rk")
-        self.assertEqual(resultRec.fields.data, b"mydata")
+        status, resultRec = missRead.result()
+        assert status.code == 404
+
+        status, resultRec = hitRead.result()
+        assert status.is2xxOK(), status.message
+        assert resultRec.fields.partitionKey == pk1
+        assert resultRec.fields.rangeKey == b"test1rk"
+        assert resultRec.fields.data == b"mydata"
 
         # Commit
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # Commit again, should fail
         status = txn.end()
-        self.assertEqual(status.code, 410)
+        assert status.code == 410
 
        # Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # read data
-        record = TestHTTP.schema.make_record(partitionKey=b"test1pk", rangeKey=b"test1rk")
+        record = schema.make_record(partitionKey=pk1, rangeKey=b"test1rk")
         status, resultRec = txn.read(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK());
-        self.assertEqual(resultRec.fields.partitionKey, b"test1pk")
-        self.assertEqual(resultRec.fields.rangeKey, b"test1rk")
-        self.assertEqual(resultRec.fields.data, b"mydata")
+        assert status.is2xxOK(), status.message
+        assert resultRec.fields.partitionKey == pk1
+        assert resultRec.fields.rangeKey == b"test1rk"
+        assert resultRec.fields.data == b"mydata"
 
         # Commit
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # Test partial update
         # Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Write partial upate
-        record = TestHTTP.schema.make_record(partitionKey=b"test1pk", rangeKey=b"test1rk", data=b"mydata_update")
+        record = schema.make_record(partitionKey=pk1, rangeKey=b"test1rk", data=b"mydata_update")
         record.fieldsForPartialUpdate = [2]
         status = txn.write(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # read data
         status, resultRec = txn.read(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK());
-        self.assertEqual(resultRec.fields.partitionKey, b"test1pk")
-        self.assertEqual(resultRec.fields.rangeKey, b"test1rk")
-        self.assertEqual(resultRec.fields.data, b"mydata_update")
+        assert status.is2xxOK(), status.message
+        assert resultRec.fields.partitionKey == pk1
+        assert resultRec.fields.rangeKey == b"test1rk"
+        assert resultRec.fields.data == b"mydata_update"
 
         # Commit
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
-
-
-    def test_validation(self):
-        record = TestHTTP.schema.make_record(partitionKey=b"test2pk", rangeKey=b"test1rk", data=b"mydata")
-        # Get a txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
-
-        # Write/read with bad collection name, should fail
-        status = txn.write(b"HTTPClient1", record)
-        self.assertEqual(status.code, 404)
-        status, _ = txn.read(b"HTTPClient1", record)
-        self.assertEqual(status.code, 404)
-
-        # # Write/Read with bad schemaName, should fail
-        bad_loc = copy(record)
-        bad_loc.schemaName = b"test_schema1"
-        status = txn.write(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 404)
-        status, _ = txn.read(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 404)
-
-        # Write with bad schema version, should fail
-        bad_loc = copy(record)
-        bad_loc.schemaVersion = 2
-        status = txn.write(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 404)
-
-        # Write/Read with bad partition key data type, should fail
-        bad_loc = TestHTTP.schema.make_record(partitionKey=1, rangeKey=b"test1rk", data=b"mydata")
-        status = txn.write(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 400)
-        status, _ = txn.read(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 400)
-
-        # Write/Read with bad range key data type, should fail
-        bad_loc = TestHTTP.schema.make_record(partitionKey=b"test2pk", rangeKey=1, data=b"mydata")
-        status = txn.write(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 400)
-
-        # Write with bad data field data type, should fail
-        bad_loc = TestHTTP.schema.make_record(partitionKey=b"test2pk", rangeKey=1, data=1)
-        status = txn.write(TestHTTP.cname, bad_loc)
-        self.assertEqual(status.code, 400)
-
-        # End transaction, should succeed
-        status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
 
     # Test read write conflict between two transactions
-    def test_read_write_txn(self):
-        record = TestHTTP.schema.make_record(partitionKey=b"ptest3", rangeKey=b"rtest3", data=b"data3")
+    def test_read_write_txn(self, cl, schema, key_prefix):
+        pk = key_prefix + b"ptest3"
+        record = schema.make_record(partitionKey=pk, rangeKey=b"rtest3", data=b"data3")
 
         # additional_data =  { "data" :"data3"}
 
         # Populate initial data, Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertEqual(status.code, 201)
+        status, txn = cl.begin_txn()
+        assert status.code == 201
 
         # Write initial data
         status = txn.write(TestHTTP.cname, record)
-        self.assertEqual(status.code, 201)
+        assert status.code == 201
 
         # Commit initial data
         status = txn.end()
-        self.assertEqual(status.code, 200)
+        assert status.code == 200
 
         # Begin Txn 1
-        status, txn1 = TestHTTP.cl.begin_txn()
-        self.assertEqual(status.code, 201)
+        status, txn1 = cl.begin_txn()
+        assert status.code == 201
 
         # Begin Txn 2
-        status, txn2 = TestHTTP.cl.begin_txn()
-        self.assertEqual(status.code, 201)
+        status, txn2 = cl.begin_txn()
+        assert status.code == 201
 
         # Read by Txn 2
         status, resultRec = txn2.read(TestHTTP.cname, record)
-        self.assertEqual(status.code, 200)
-        self.assertEqual(resultRec.fields.partitionKey, b"ptest3")
-        self.assertEqual(resultRec.fields.rangeKey, b"rtest3")
-        self.assertEqual(resultRec.fields.data, b"data3")
+        assert status.code == 200
+        assert resultRec.fields.partitionKey == pk
+        assert resultRec.fields.rangeKey == b"rtest3"
+        assert resultRec.fields.data == b"data3"
 
         # Update data by Txn 1, should fail with 403: write request cannot be allowed as
         # this key (or key range) has been observed by another transaction.
         status = txn1.write(TestHTTP.cname, record)
-        self.assertEqual(status.code, 403)
+        assert status.code == 403
 
         # Commit Txn 1, same error as write request
         status = txn1.end()
-        self.assertEqual(status.code, 403)
+        assert status.code == 403
 
         # Commit Txn 2, should succeed
         status = txn2.end()
-        self.assertEqual(status.code, 200)
+        assert status.code == 200
 
-    def test_collection_schema_basic(self):
+    def test_collection_schema_basic(self, cl):
         test_coll =  b'HTTPProxy1'
         metadata = CollectionMetadata(name =test_coll,
             hashScheme =  HashScheme.HashCRC32C,
@@ -254,53 +249,51 @@ class TestHTTP(unittest.TestCase):
             capacity = CollectionCapacity(minNodes = 1),
             retentionPeriod = TimeDelta(hours=5)
         )
-        status = TestHTTP.cl.create_collection(metadata)
-        self.assertTrue(status.is2xxOK(), msg=status.message)
-
         test_schema = Schema(name=b'tests', version=1,
             fields=[
                 SchemaField(FieldType.STRING, b'pkey1'),
                 SchemaField(FieldType.INT32T, b'rkey1'),
                 SchemaField(FieldType.STRING, b'datafield1')],
             partitionKeyFields=[0], rangeKeyFields=[1])
-        status = TestHTTP.cl.create_schema(test_coll, test_schema)
-        self.assertTrue(status.is2xxOK())
+        status, _ = ensure_collection_schema(cl, metadata, test_schema)
+        assert status.is2xxOK(), status.message
 
-        status, schema1 = TestHTTP.cl.get_schema(test_coll, b"tests", 1)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual(test_schema, schema1)
+        status, schema1 = cl.get_schema(test_coll, b"tests", 1)
+        assert status.is2xxOK(), status.message
+        assert test_schema == schema1
 
         # Get a non existing schema, should fail
-        status, _ = TestHTTP.cl.get_schema(test_coll, b"tests_1", 1)
-        self.assertEqual(status.code, 404)
+        status, _ = cl.get_schema(test_coll, b"tests_1", 1)
+        assert status.code == 404
 
         # Read write using the schema
         record = test_schema.make_record(pkey1=b"ptest4", rkey1=4, datafield1=b"data4")
         # Populate data, Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Write initial data
         status = txn.write(test_coll, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         status, record1 = txn.read(test_coll, record)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual(record.fields.datafield1, b"data4")
-        self.assertEqual(record.fields.pkey1, b"ptest4")
-        self.assertEqual(record.fields.rkey1, 4)
+        assert status.is2xxOK(), status.message
+        assert record.fields.datafield1 == b"data4"
+        assert record.fields.pkey1 == b"ptest4"
+        assert record.fields.rkey1 == 4
 
         # Commit Txn, should succeed
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
-    def test_create_schema_validation(self):
+    @pytest.mark.usefixtures("schema")
+    def test_create_schema_validation(self, cl):
         # Create schema with no field, should fail
         schema = Schema(name=b'tests2', version=1,
             fields=[], partitionKeyFields=[], rangeKeyFields=[])
 
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, schema)
-        self.assertEqual(status.code, 400, msg=status.message)
+        status = cl.create_schema(TestHTTP.cname, schema)
+        assert status.code == 400, status.message
 
         # No partition Key, should fail
         schema = Schema(name=b'tests2', version=1,
@@ -310,8 +303,8 @@ class TestHTTP(unittest.TestCase):
                 SchemaField(FieldType.STRING, b'datafield1')],
             partitionKeyFields=[], rangeKeyFields=[1])
 
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, schema)
-        self.assertEqual(status.code, 400, msg=status.message)
+        status = cl.create_schema(TestHTTP.cname, schema)
+        assert status.code == 400, status.message
 
         # Duplicate Key, should fail
         schema = Schema(name=b'tests2', version=1,
@@ -321,8 +314,8 @@ class TestHTTP(unittest.TestCase):
                 SchemaField(FieldType.STRING, b'datafield1')],
             partitionKeyFields=[0], rangeKeyFields=[])
 
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, schema)
-        self.assertEqual(status.code, 400, msg=status.message)
+        status = cl.create_schema(TestHTTP.cname, schema)
+        assert status.code == 400, status.message
 
         # Valid request, should succeed
         schema = Schema(name=b'tests2', version=1,
@@ -332,14 +325,14 @@ class TestHTTP(unittest.TestCase):
                 SchemaField(FieldType.STRING, b'datafield1')],
             partitionKeyFields=[0], rangeKeyFields=[1])
 
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, schema)
-        self.assertTrue(status.is2xxOK())
+        status = cl.create_schema(TestHTTP.cname, schema)
+        assert status.is2xxOK(), status.message
 
         # Create the same schema again, should fail
-        status = TestHTTP.cl.create_schema(TestHTTP.cname, schema)
-        self.assertEqual(status.code, 403, msg=status.message)
+        status = cl.create_schema(TestHTTP.cname, schema)
+        assert status.code == 403, status.message
 
-    def test_query(self):
+    def test_query(self, cl):
         test_coll = b'query_collection'
         metadata = CollectionMetadata(name = test_coll,
             hashScheme =  HashScheme.Range,
@@ -353,14 +346,14 @@ class TestHTTP(unittest.TestCase):
         status, endspec = db.get_key_string([
             FieldValue(FieldType.STRING, "default"),
             FieldValue(FieldType.STRING, "d")])
-        self.assertEqual(status.code, 200, msg=status.message)
-        self.assertEqual(endspec, "^01default^00^01^01d^00^01")
+        assert status.code == 200, status.message
+        assert endspec == "^01default^00^01^01d^00^01"
         '''
         # Use offline calculated range key for now
         endspec = b"^01default^00^01^01d^00^01"
-        status = TestHTTP.cl.create_collection(metadata,
+        status = cl.create_collection(metadata,
             rangeEnds = [endspec, b""])
-        self.assertTrue(status.is2xxOK(), msg=status.message)
+        assert status.is2xxOK(), status.message
 
         test_schema = Schema(name=b'query_test', version=1,
             fields=[
@@ -371,177 +364,177 @@ class TestHTTP(unittest.TestCase):
                 SchemaField(FieldType.INT32T, b'record_id')
                 ],
             partitionKeyFields=[0, 1], rangeKeyFields=[2])
-        status = TestHTTP.cl.create_schema(test_coll, test_schema)
-        self.assertTrue(status.is2xxOK())
+        status = cl.create_schema(test_coll, test_schema)
+        assert status.is2xxOK(), status.message
 
         # Populate initial data, Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Write initial data
         record = test_schema.make_record(partition=b"default", partition1=b'a',
             range=b"rtestq", data1=b"dataq", record_id=1)
 
         status = txn.write(test_coll, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, record1 = txn.read(test_coll, record)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual(record.data, record1.data)
+        assert status.is2xxOK(), status.message
+        assert record.data == record1.data
 
         record = test_schema.make_record(partition=b"default", partition1=b'h',
             range=b"arq1", data1=b"adq1", record_id=2)
         # loc1 = loc.get_new(partition_key=["default", "h"], range_key="arq1")
         status = txn.write(test_coll, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, record2 = txn.read(test_coll, record)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual(record.data, record2.data)
+        assert status.is2xxOK(), status.message
+        assert record.data == record2.data
 
         # Commit initial data
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Start from partition1=h, should return record2
         key = test_schema.make_record(partition=b"default", partition1=b'h')
         status, query = txn.create_query(test_coll, test_schema.name, start = key)
-        self.assertTrue(status.is2xxOK(), msg=status.message)
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record2.data]
 
         # End to partition1=h, should return record1
         status, query = txn.create_query(test_coll, test_schema.name, end = key)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record1.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record1.data]
 
         # Limit 1
         status, query = txn.create_query(test_coll, test_schema.name, limit = 1)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record1.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record1.data]
 
         # Limit 1 from reverse
         status, query = txn.create_query(test_coll, test_schema.name, limit = 1, reverse = True)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record2.data]
 
         # Query all, should return record1 and 2
         status, query = txn.create_query(test_coll, test_schema.name)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record1.data, record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record1.data, record2.data]
 
         # Prefix scan on first key field, should return record1 and 2
         key = test_schema.make_prefix_record(partition=b"default")
         status, query = txn.create_query(test_coll, test_schema.name, start = key, end = key)
-        self.assertTrue(status.is2xxOK(), msg=status.message)
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record1.data, record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record1.data, record2.data]
 
         # Query all, with reverse = True
         status, query = txn.create_query(test_coll, test_schema.name, reverse = True)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record2.data, record1.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record2.data, record1.data]
 
         # Do the same query but with filter data1=data1, should only return record2
         filter = Expression(Operation.EQ,
             values = [Value(b"data1"), Value(fieldType=FieldType.STRING, literal=b"adq1")])
         status, query = txn.create_query(test_coll, test_schema.name, filter=filter)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record2.data]
 
         # Do the same query but with filter record_id=1, should only return record1
         filter = Expression(Operation.EQ,
             values = [Value(b"record_id"), Value(fieldType=FieldType.INT32T, literal=1)])
         status, query = txn.create_query(test_coll, test_schema.name, filter=filter)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK())
-        self.assertEqual([r.data for r in records], [record1.data])
-        self.assertNotEqual([r.data for r in records], [record2.data])
+        assert status.is2xxOK(), status.message
+        assert [r.data for r in records] == [record1.data]
+        assert [r.data for r in records] != [record2.data]
 
         #  Test projection
         status, query = txn.create_query(test_coll, test_schema.name, projection=[b"data1", b"record_id"])
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
         status, records = txn.queryAll(query)
-        self.assertTrue(status.is2xxOK(), msg=status.message)
+        assert status.is2xxOK(), status.message
         subset = lambda d, keys: {k: d[k] for k in  [b"data1", b"record_id"]}
-        self.assertEqual([r.data for r in records], [
+        assert [r.data for r in records] == [
             {'partition': None, 'partition1': None, 'range': None, 'data1': b'dataq', 'record_id': 1},
-            {'partition': None, 'partition1': None, 'range': None, 'data1': b'adq1', 'record_id': 2}])
+            {'partition': None, 'partition1': None, 'range': None, 'data1': b'adq1', 'record_id': 2}]
 
         # Send reverse with invalid type, should fail with type error
         status, query = txn.create_query(test_coll, test_schema.name, limit = 1, reverse = 5)
-        self.assertEqual(status.code, 400)
+        assert status.code == 400
 
         # Send reverse with invalid type, should fail with type error
         status, query = txn.create_query(test_coll, test_schema.name, limit = "test", reverse = 5)
-        self.assertEqual(status.code, 400)
+        assert status.code == 400
 
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # Try to make record that is not a prefix, should be caught by python library
-        with self.assertRaises(ValueError):
+        with pytest.raises(ValueError):
             bad_record = test_schema.make_prefix_record(partition1=b"h")
 
-    def test_txn_timeout(self):
+    def test_txn_timeout(self, cl, schema, key_prefix):
         # The tests assume that txn timeout is set to 100ms (httpproxy_txn_timeout)
         # And periodic timer runs at 50ms interval (httpproxy_expiry_timer_interval)
         # Begin Txn
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Sleep 160ms for txn to timeout
         sleep(0.16)
         status = txn.end()
-        self.assertEqual(status.code, 410)
+        assert status.code == 410
 
-        status, txn = TestHTTP.cl.begin_txn()
-        self.assertTrue(status.is2xxOK())
+        status, txn = cl.begin_txn()
+        assert status.is2xxOK(), status.message
 
         # Sleep 80ms and write, it should succeed because within timeout
         sleep(0.08)
-        record = TestHTTP.schema.make_record(partitionKey=b"ptest6", rangeKey=b"rtest6", data=b"data6")
+        record = schema.make_record(partitionKey=key_prefix + b"ptest6", rangeKey=b"rtest6", data=b"data6")
         status = txn.write(TestHTTP.cname, record)
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
         # Sleep additional 80ms and commit, should succeed as timeout pushed back because of write
         sleep(0.08)
         # Commit
         status = txn.end()
-        self.assertTrue(status.is2xxOK())
+        assert status.is2xxOK(), status.message
 
 '''
-    def test_key_string(self):
-        db = SKVClient(args.http)
+    def test_key_string(self, cl):
+        db = cl
         field1 = FieldValue(FieldType.STRING, "default")
         field2 = FieldValue(FieldType.STRING, "d\x00ef")
         status, endspec = db.get_key_string([field1, field2])
-        self.assertEqual(status.code, 200, msg=status.message)
+        assert status.code == 200, status.message
         print(field2)
-        self.assertEqual(endspec, "^01default^00^01^01d^00^ffef^00^01")
+        assert endspec == "^01default^00^01^01d^00^ffef^00^01"
 
         field3 = FieldValue(FieldType.INT32T, 10)
         status, endspec = db.get_key_string([field1, field3])
-        self.assertEqual(status.code, 200, msg=status.message)
-        self.assertEqual(endspec, "^01default^00^01^02^03^00^0a^00^01")
+        assert status.code == 200, status.message
+        assert endspec == "^01default^00^01^02^03^00^0a^00^01"
 
-    def test_metrics(self):
+    def test_metrics(self, cl, args):
         "Verify some metrics are populated"
         mclient = MetricsClient(args.prometheus, [
             Counter("HttpProxy", "session", "open_txns"),
@@ -551,12 +544,12 @@ class TestHTTP(unittest.TestCase):
             Histogram("HttpProxy", "K23SI_client", "txn_duration")
             ]
         )
-        db = SKVClient(args.http)
+        db = cl
 
         prev = mclient.refresh()
         status, txn = db.begin_txn()
         curr = mclient.refresh()
-        self.assertEqual(curr.open_txns, prev.open_txns+1)
+        assert curr.open_txns == prev.open_txns+1
 
         loc = DBLoc(partition_key_name="partitionKey", range_key_name="rangeKey",
             partition_key="ptest2", range_key="rtest2",
@@ -566,24 +559,51 @@ class TestHTTP(unittest.TestCase):
         # Write with bad range key data type, should fail
         bad_loc = loc.get_new(range_key=1)
         status = txn.write(bad_loc, additional_data)
-        self.assertEqual(status.code, 400, msg=status.message)
+        assert status.code == 400, status.message
         curr = mclient.refresh()
-        self.assertEqual(curr.deserialization_errors, prev.deserialization_errors+1)
+        assert curr.deserialization_errors == prev.deserialization_errors+1
 
         status = txn.end()
-        self.assertEqual(status.code, 200, msg=status.message)
+        assert status.code == 200, status.message
         curr = mclient.refresh()
-        self.assertEqual(curr.open_txns, prev.open_txns)
-        self.assertEqual(curr.txn_begin_latency, prev.txn_begin_latency+1)
-        self.assertEqual(curr.txn_end_latency, prev.txn_end_latency+1)
-        self.assertEqual(curr.txn_duration, prev.txn_duration+1)
+        assert curr.open_txns == prev.open_txns
+        assert curr.txn_begin_latency == prev.txn_begin_latency+1
+        assert curr.txn_end_latency == prev.txn_end_latency+1
+        assert curr.txn_duration == prev.txn_duration+1
 '''
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--http", help="HTTP API URL")
-    parser.add_argument("--prometheus", default="http://localhost:8089", help="HTTP Proxy Prometheus port")
-    TestHTTP.args = parser.parse_args()
+class TestValidation:
+    "Write/read requests the server must reject, issued within one txn shared by all cases"
+
+    # mutate(schema, record) returns the bad record, checkRead: a read of it fails the same way
+    @pytest.mark.parametrize("collection, mutate, code, checkRead", [
+        pytest.param(b"HTTPClient1", lambda schema, rec: rec, 404, True,
+            id="bad_collection_name"),
+        pytest.param(TestHTTP.cname, lambda schema, rec: rec._replace(schemaName=b"test_schema1"), 404, True,
+            id="bad_schema_name"),
+        pytest.param(TestHTTP.cname, lambda schema, rec: rec._replace(schemaVersion=2), 404, False,
+            id="bad_schema_version"),
+        pytest.param(TestHTTP.cname,
+            lambda schema, rec: schema.make_record(partitionKey=1, rangeKey=b"test1rk", data=b"mydata"), 400, True,
+            id="bad_partition_key_type"),
+        pytest.param(TestHTTP.cname,
+            lambda schema, rec: schema.make_record(partitionKey=rec.fields.partitionKey, rangeKey=1, data=b"mydata"), 400, False,
+            id="bad_range_key_type"),
+        pytest.param(TestHTTP.cname,
+            lambda schema, rec: schema.make_record(partitionKey=rec.fields.partitionKey, rangeKey=1, data=1), 400, False,
+            id="bad_data_type"),
+    ])
+    def test_validation(self, validation_txn, schema, key_prefix, collection, mutate, code, checkRead):
+        record = schema.make_record(partitionKey=key_prefix + b"test2pk", rangeKey=b"test1rk", data=b"mydata")
+        bad_loc = mutate(schema, record)
+
+        # Write/read with the bad record, should fail
+        status = validation_txn.write(collection, bad_loc)
+        assert status.code == code, status.message
+        if checkRead:
+            status, _ = validation_txn.read(collection, bad_loc)
+            assert status.code == code, status.message
 
-    del sys.argv[1:]
-    unittest.main()
+if __name__ == '__main__':
+    # options such as --http and --prometheus are registered in conftest.py
+    sys.exit(pytest.main([__file__] + sys.argv[1:]))